@@ -1,5 +1,9 @@
 import os
+import time
 import json
+import asyncio
+import threading
+import contextlib
 import logging
 import random
 import sqlite3
@@ -10,14 +14,16 @@ load_dotenv()
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
 
 # Import your model
-from ForecastModel import forecast_co2
+from ForecastModel import forecast_co2, forecast_co2_stream, MODEL_VERSION
 
 # Gemini client
 import google.generativeai as genai
@@ -28,8 +34,26 @@ logger = logging.getLogger(__name__)
 # ---------- SQLite ----------
 DB_PATH = "database.db"
 
+# Política de retención (por tabla)
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "500"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CONSEQUENCES_TTL_SECONDS = int(os.getenv("CONSEQUENCES_TTL_SECONDS", str(7 * 24 * 3600)))
+DB_COMPACT_INTERVAL_SECONDS = int(os.getenv("DB_COMPACT_INTERVAL_SECONDS", "3600"))
+# Espera máxima por el lock de SQLite (el VACUUM lo toma en exclusiva)
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "30"))
+
+CACHE_TABLES = ("forecast_cache", "consequences")
+
+# Columnas añadidas a las tablas ya existentes en database.db
+RETENTION_COLUMNS = {
+    "version": "TEXT",
+    "created_at": "REAL NOT NULL DEFAULT 0",
+    "last_access": "REAL NOT NULL DEFAULT 0",
+    "size_bytes": "INTEGER NOT NULL DEFAULT 0",
+}
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
     cur = conn.cursor()
 
     # Store forecast results
@@ -51,24 +75,86 @@ def init_db():
         )
     """)
 
+    for table in CACHE_TABLES:
+        existing = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+        for column, decl in RETENTION_COLUMNS.items():
+            if column not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_access ON {table} (last_access)")
+
+    # Las filas de un modelo/dataset anterior ya no son válidas
+    db_purge(cur)
+
     conn.commit()
     conn.close()
 
+def db_purge(cur):
+    now = time.time()
+    for table in CACHE_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE version IS NULL OR version != ?", (MODEL_VERSION,))
+    cur.execute("DELETE FROM consequences WHERE created_at < ?", (now - CONSEQUENCES_TTL_SECONDS,))
+
+def db_evict(cur, table: str):
+    # LRU: conservar las filas accedidas más recientemente dentro de los límites
+    cur.execute(f"""
+        DELETE FROM {table} WHERE months IN (
+            SELECT months FROM {table} ORDER BY last_access DESC LIMIT -1 OFFSET ?
+        )
+    """, (CACHE_MAX_ROWS,))
+    cur.execute(f"""
+        DELETE FROM {table} WHERE months IN (
+            SELECT months FROM (
+                SELECT months, SUM(size_bytes) OVER (ORDER BY last_access DESC, months) AS total
+                FROM {table}
+            ) WHERE total > ?
+        )
+    """, (CACHE_MAX_BYTES,))
+
+def db_compact():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
+    cur = conn.cursor()
+    db_purge(cur)
+    for table in CACHE_TABLES:
+        db_evict(cur, table)
+    conn.commit()
+    # VACUUM no puede correr dentro de una transacción
+    conn.execute("VACUUM")
+    conn.close()
+
+def db_touch(conn, table: str, months: int):
+    # Best-effort: si la base está bloqueada (p. ej. durante el VACUUM)
+    # se omite la actualización; solo afecta al orden LRU
+    try:
+        conn.execute(f"UPDATE {table} SET last_access = ? WHERE months = ?", (time.time(), months))
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Could not update last_access in {table} for {months} months: {e}")
+
 def db_save_forecast(months: int, forecast: Dict[str, Any]):
-    conn = sqlite3.connect(DB_PATH)
+    payload = (json.dumps(forecast["dates"]), json.dumps(forecast["predictions"]),
+               json.dumps(forecast["last_16_dates"]), json.dumps(forecast["last_16_values"]))
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
     cur = conn.cursor()
     cur.execute("""
-        INSERT OR REPLACE INTO forecast_cache (months, dates, predictions,LASTDATES,LASTVALUES)
-        VALUES (?, ?, ?, ?, ?)
-    """, (months, json.dumps(forecast["dates"]), json.dumps(forecast["predictions"]),json.dumps(forecast["last_16_dates"]), json.dumps(forecast["last_16_values"])))
+        INSERT OR REPLACE INTO forecast_cache (months, dates, predictions, LASTDATES, LASTVALUES,
+                                               version, created_at, last_access, size_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (months, *payload, MODEL_VERSION, now, now, sum(len(p) for p in payload)))
+    db_evict(cur, "forecast_cache")
     conn.commit()
     conn.close()
 
 def db_load_forecast(months: int) -> Optional[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
     cur = conn.cursor()
-    cur.execute("SELECT dates, predictions, LASTDATES, LASTVALUES FROM forecast_cache WHERE months = ?", (months,))
+    cur.execute("""
+        SELECT dates, predictions, LASTDATES, LASTVALUES FROM forecast_cache
+        WHERE months = ? AND version = ?
+    """, (months, MODEL_VERSION))
     row = cur.fetchone()
+    if row:
+        db_touch(conn, "forecast_cache", months)
     conn.close()
     if not row:
         return None
@@ -80,20 +166,29 @@ def db_load_forecast(months: int) -> Optional[Dict[str, Any]]:
     }
 
 def db_save_consequences(months: int, consequences: List[Dict[str, Any]]):
-    conn = sqlite3.connect(DB_PATH)
+    payload = json.dumps(consequences)
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
     cur = conn.cursor()
     cur.execute("""
-        INSERT OR REPLACE INTO consequences (months, json)
-        VALUES (?, ?)
-    """, (months, json.dumps(consequences)))
+        INSERT OR REPLACE INTO consequences (months, json, version, created_at, last_access, size_bytes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (months, payload, MODEL_VERSION, now, now, len(payload)))
+    db_evict(cur, "consequences")
     conn.commit()
     conn.close()
 
 def db_load_consequences(months: int) -> Optional[List[Dict[str, Any]]]:
-    conn = sqlite3.connect(DB_PATH)
+    now = time.time()
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT_SECONDS)
     cur = conn.cursor()
-    cur.execute("SELECT json FROM consequences WHERE months = ?", (months,))
+    cur.execute("""
+        SELECT json FROM consequences
+        WHERE months = ? AND version = ? AND created_at >= ?
+    """, (months, MODEL_VERSION, now - CONSEQUENCES_TTL_SECONDS))
     row = cur.fetchone()
+    if row:
+        db_touch(conn, "consequences", months)
     conn.close()
     if not row:
         return None
@@ -257,6 +352,12 @@ GMAIL_PASSWORD = os.getenv("GMAIL_PASSWORD")
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 
+# === Streaming ===
+MAX_STREAM_MONTHS = int(os.getenv("MAX_STREAM_MONTHS", "12000"))
+STREAM_CHUNK_MONTHS = int(os.getenv("STREAM_CHUNK_MONTHS", "120"))
+if STREAM_CHUNK_MONTHS < 1:
+    raise ValueError("STREAM_CHUNK_MONTHS must be >= 1")
+
 
 # ===== Modelo del cuerpo del request =====
 class EmailRequest(BaseModel):
@@ -334,8 +435,29 @@ def forecast_co2_json(months: int) -> Dict[str, Any]:
     return out
 
 
+# ---------- Compactación en segundo plano ----------
+async def db_compaction_loop():
+    while True:
+        await asyncio.sleep(DB_COMPACT_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(db_compact)
+            logger.info("Database compacted")
+        except Exception as e:
+            logger.error(f"Database compaction failed: {e}")
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    compaction_task = asyncio.create_task(db_compaction_loop())
+    try:
+        yield
+    finally:
+        compaction_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await compaction_task
+
+
 # ---------- FastAPI ----------
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_sub = "/api/1"
 
 app.add_middleware(
@@ -396,6 +518,43 @@ async def getForecast(months: int = 5):
     return {"data": forecas, "Consequences": conseq}
 
 
+@app.get(f"{api_sub}/forecast/{{months}}/stream")
+async def getForecastStream(months: int, request: Request):
+
+    if months <= 0:
+        return {"error": "months must be positive"}
+    if months > MAX_STREAM_MONTHS:
+        return {"error": f"months must be <= {MAX_STREAM_MONTHS}"}
+
+    # El rollout corre en un hilo del threadpool; no se puede cerrar el
+    # generador mientras next() se ejecuta, así que se le avisa con un Event
+    cancel = threading.Event()
+    chunks = forecast_co2_stream(months, STREAM_CHUNK_MONTHS, cancel)
+
+    async def ndjson():
+        try:
+            while True:
+                # Si el cliente se fue, dejamos de avanzar el rollout
+                if await request.is_disconnected():
+                    logger.info(f"Client disconnected, stopping {months}-month stream")
+                    break
+
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+
+                dates, preds = chunk
+                yield "".join(
+                    json.dumps({"date": d.strftime("%Y-%m-%d"), "prediction": float(p)}) + "\n"
+                    for d, p in zip(dates, preds)
+                )
+        finally:
+            # También cubre la cancelación de la tarea por Starlette
+            cancel.set()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @app.get(f"{api_sub}/actions")
 async def getActions5():
     pool = list(acciones_climaticas.items())
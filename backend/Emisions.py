@@ -6,17 +6,43 @@ Modelo LSTM estilo 'airline passengers', pero aplicado al CO2:
 - Carga y guarda igual que el ejemplo clásico
 """
 
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import tensorflow as tf
 from keras.models import Sequential, load_model
 from keras.layers import Dense, LSTM, Input, Dropout
+from keras.callbacks import Callback, EarlyStopping
 from sklearn.preprocessing import MinMaxScaler
 
 DATA_FILE = "co2_mm_mlo.csv"
 MODEL_FILE = "lstm_co2.keras"
 LOOK_BACK = 12  # como tu WINDOW_SIZE
+HORIZON = 12  # meses que emite el modelo directo en cada llamada
+DIRECT_MODEL_FILE = "ModelDirect.keras"
+DIRECT_SCALER_FILE = "ScalerDirect.pkl"
+
+# Búsqueda de hiperparámetros (python Emisions.py search)
+SEARCH_SPACE = {
+    "look_back": [6, 12, 24, 36],
+    "units": [(96, 64), (128, 64), (64,), (32, 16)],
+    "batch_size": [20, 64],
+}
+SEARCH_EPOCHS = 200
+SEARCH_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+THREADS_PER_WORKER = max(1, (os.cpu_count() or 1) // SEARCH_WORKERS)
+PRUNE_EVERY = 25    # épocas entre cada revisión de poda
+PRUNE_FACTOR = 1.5  # se poda si val RMSE > factor * mejor val RMSE en esa época
+LEADERBOARD_FILE = "search_leaderboard.csv"
 
 
 # =========================================================
@@ -51,6 +77,46 @@ def create_dataset(dataset, look_back=1):
     return np.array(X), np.array(Y)
 
 
+# =========================================================
+# 2b. Dataset multi-horizonte (salida = próximos H meses)
+# =========================================================
+def create_dataset_multi(dataset, look_back=1, horizon=1):
+    X, Y = [], []
+    for i in range(len(dataset) - look_back - horizon + 1):
+        X.append(dataset[i:(i + look_back), 0])
+        Y.append(dataset[(i + look_back):(i + look_back + horizon), 0])
+    return np.array(X), np.array(Y)
+
+
+def rolling_onestep_predict(model, X, horizon):
+    """
+    Aplica el modelo de un paso de forma autoregresiva sobre todas las
+    ventanas de X a la vez, devolviendo (n, horizon) predicciones escaladas.
+    Sirve para comparar contra el modelo directo con las mismas ventanas.
+    """
+    window = X.copy()
+    preds = []
+    for _ in range(horizon):
+        next_value = model.predict(window, verbose=0)[:, 0]
+        preds.append(next_value)
+        window = np.concatenate([window[:, 1:, :], next_value.reshape(-1, 1, 1)], axis=1)
+    return np.stack(preds, axis=1)
+
+
+# =========================================================
+# 3. Arquitectura
+# =========================================================
+def build_model(look_back, units=(96, 64), horizon=1):
+    layers = [Input(shape=(look_back, 1))]
+    for i, n in enumerate(units):
+        layers.append(LSTM(n, return_sequences=i < len(units) - 1))
+    layers += [Dense(32), Dense(horizon)]
+
+    model = Sequential(layers)
+    model.compile(loss="mse", optimizer="adam")
+    return model
+
+
 # =========================================================
 # MAIN
 # =========================================================
@@ -78,14 +144,7 @@ def main():
     # ===============================
     # 5. Modelo LSTM estilo Airline
     # ===============================
-    model = Sequential([
-        Input(shape=(LOOK_BACK, 1)),
-        LSTM(96, return_sequences=True),
-        LSTM(64),
-        Dense(32),
-        Dense(1)
-    ])
-    model.compile(loss="mse", optimizer="adam")
+    model = build_model(LOOK_BACK, units=(96, 64), horizon=1)
 
     model.fit(trainX, trainY, epochs=200, batch_size=20, verbose=1)
 
@@ -166,4 +225,258 @@ def main():
     plt.savefig("co2_forecast.png", dpi=150)
     plt.show()
 
-main()
+
+# =========================================================
+# MAIN DIRECTO (multi-horizonte)
+# =========================================================
+def main_direct():
+    from sklearn.metrics import mean_squared_error
+
+    # 1. Cargar y normalizar
+    data = load_co2()
+    scaler = MinMaxScaler()
+    data_scaled = scaler.fit_transform(data)
+
+    train_size = int(len(data_scaled) * 0.80)
+    train, test = data_scaled[:train_size], data_scaled[train_size:]
+
+    # 2. Ventanas con salida de HORIZON meses
+    trainX, trainY = create_dataset_multi(train, LOOK_BACK, HORIZON)
+    testX, testY = create_dataset_multi(test, LOOK_BACK, HORIZON)
+
+    trainX = trainX.reshape((trainX.shape[0], LOOK_BACK, 1))
+    testX = testX.reshape((testX.shape[0], LOOK_BACK, 1))
+
+    # ===============================
+    # 3. Modelo LSTM con cabeza directa
+    # ===============================
+    model = build_model(LOOK_BACK, units=(96, 64), horizon=HORIZON)
+
+    model.fit(trainX, trainY, epochs=200, batch_size=20, verbose=1)
+
+    # Scaler propio: ScalerFinal.pkl pertenece a ModelFinal.keras
+    joblib.dump(scaler, DIRECT_SCALER_FILE)
+    model.save(DIRECT_MODEL_FILE)
+
+    # ===============================
+    # 4. Scores (RMSE) sobre los H meses
+    # ===============================
+    def rmse(y_true, y_pred):
+        y_true = scaler.inverse_transform(y_true.reshape(-1, 1))
+        y_pred = scaler.inverse_transform(y_pred.reshape(-1, 1))
+        return np.sqrt(mean_squared_error(y_true[:, 0], y_pred[:, 0]))
+
+    trainScore = rmse(trainY, model.predict(trainX))
+    testScore = rmse(testY, model.predict(testX))
+
+    print(f"Direct ({HORIZON} meses) Train Score: {trainScore:.2f} RMSE")
+    print(f"Direct ({HORIZON} meses) Test Score:  {testScore:.2f} RMSE")
+
+    # ===============================
+    # 5. Comparación con el modelo de un paso
+    # ===============================
+    try:
+        onestep = load_model(MODEL_FILE)
+    except Exception:
+        print(f"No se encontró {MODEL_FILE}; entrena primero el modelo de un paso para comparar.")
+        return
+
+    trainScore1 = rmse(trainY, rolling_onestep_predict(onestep, trainX, HORIZON))
+    testScore1 = rmse(testY, rolling_onestep_predict(onestep, testX, HORIZON))
+
+    print(f"One-step ({HORIZON} meses) Train Score: {trainScore1:.2f} RMSE")
+    print(f"One-step ({HORIZON} meses) Test Score:  {testScore1:.2f} RMSE")
+
+
+# =========================================================
+# BÚSQUEDA PARALELA DE HIPERPARÁMETROS
+# =========================================================
+class PruneCallback(Callback):
+    """
+    Cada PRUNE_EVERY épocas compara el val RMSE del trial con el mejor
+    registrado por cualquier worker en esa misma época y lo detiene si
+    es PRUNE_FACTOR veces peor.
+    """
+
+    def __init__(self, best, lock):
+        super().__init__()
+        self.best = best
+        self.lock = lock
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        step = epoch + 1
+        if step % PRUNE_EVERY or "val_loss" not in (logs or {}):
+            return
+
+        rmse = float(np.sqrt(logs["val_loss"]))
+        with self.lock:
+            best = self.best.get(step)
+            if best is None or rmse < best:
+                self.best[step] = rmse
+
+        if best is not None and rmse > PRUNE_FACTOR * best:
+            self.pruned = True
+            self.model.stop_training = True
+
+
+def init_search_worker(threads):
+    # Evita que los pools intra-op de TF de cada proceso compitan por los núcleos
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_trial(trial_id, config, data_path, scaler, out_dir, best, lock):
+    from sklearn.metrics import mean_squared_error
+
+    look_back = config["look_back"]
+
+    # Serie escalada compartida entre procesos (solo lectura)
+    data_scaled = np.load(data_path, mmap_mode="r")
+    train_size = int(len(data_scaled) * 0.80)
+    train, test = data_scaled[:train_size], data_scaled[train_size:]
+
+    trainX, trainY = create_dataset(train, look_back)
+    testX, testY = create_dataset(test, look_back)
+    trainX = trainX.reshape((trainX.shape[0], look_back, 1))
+    testX = testX.reshape((testX.shape[0], look_back, 1))
+
+    model = build_model(look_back, units=config["units"], horizon=1)
+    prune = PruneCallback(best, lock)
+
+    start = time.perf_counter()
+    history = model.fit(
+        trainX, trainY,
+        epochs=SEARCH_EPOCHS,
+        batch_size=config["batch_size"],
+        validation_split=0.1,
+        callbacks=[prune, EarlyStopping(patience=20, restore_best_weights=True)],
+        verbose=0
+    )
+    train_time = time.perf_counter() - start
+
+    # Latencia de una llamada, igual que en ForecastModel
+    window = testX[-1:]
+    model(window, training=False)
+    start = time.perf_counter()
+    for _ in range(50):
+        model(window, training=False)
+    inference_ms = (time.perf_counter() - start) / 50 * 1000
+
+    def rmse(X, Y):
+        pred = scaler.inverse_transform(model.predict(X, verbose=0))
+        real = scaler.inverse_transform(Y.reshape(-1, 1))
+        return float(np.sqrt(mean_squared_error(real[:, 0], pred[:, 0])))
+
+    model_path = os.path.join(out_dir, f"trial_{trial_id}.keras")
+    model.save(model_path)
+
+    return {
+        "trial": trial_id,
+        "look_back": look_back,
+        "units": "-".join(str(n) for n in config["units"]),
+        "batch_size": config["batch_size"],
+        "epochs": len(history.history["loss"]),
+        "pruned": prune.pruned,
+        "val_rmse_scaled": float(np.sqrt(min(history.history["val_loss"]))),
+        "train_rmse": rmse(trainX, trainY),
+        "test_rmse": rmse(testX, testY),
+        "train_time_s": train_time,
+        "inference_ms": inference_ms,
+        "model_path": model_path,
+    }
+
+
+def main_search():
+    # 1. Preprocesar una sola vez y volcar a disco para memory-map
+    data = load_co2()
+    scaler = MinMaxScaler()
+    data_scaled = scaler.fit_transform(data)
+
+    out_dir = tempfile.mkdtemp(prefix="co2_search_")
+    data_path = os.path.join(out_dir, "data_scaled.npy")
+    np.save(data_path, data_scaled)
+
+    configs = [
+        dict(zip(SEARCH_SPACE, values))
+        for values in itertools.product(*SEARCH_SPACE.values())
+    ]
+    print(f"{len(configs)} configuraciones, {SEARCH_WORKERS} workers x {THREADS_PER_WORKER} hilos")
+
+    # Los procesos hijos heredan estas variables antes de importar TF
+    os.environ["OMP_NUM_THREADS"] = str(THREADS_PER_WORKER)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(THREADS_PER_WORKER)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    # 2. Repartir los trials entre procesos
+    ctx = mp.get_context("spawn")
+    results = []
+    try:
+        with ctx.Manager() as manager:
+            best, lock = manager.dict(), manager.Lock()
+            with ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=ctx,
+                                     initializer=init_search_worker,
+                                     initargs=(THREADS_PER_WORKER,)) as pool:
+                futures = {
+                    pool.submit(run_trial, i, config, data_path, scaler, out_dir, best, lock): (i, config)
+                    for i, config in enumerate(configs)
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    trial_id, config = futures[future]
+                    try:
+                        r = future.result()
+                    except Exception as e:
+                        # Un trial fallido no debe tumbar toda la búsqueda
+                        print(f"[{done}/{len(configs)}] trial {trial_id} {config} falló: {e}")
+                        continue
+
+                    results.append(r)
+                    status = "podado" if r["pruned"] else f"val {r['val_rmse_scaled']:.4f}, test {r['test_rmse']:.2f} RMSE"
+                    print(f"[{done}/{len(configs)}] trial {r['trial']} "
+                          f"(look_back={r['look_back']}, units={r['units']}, batch={r['batch_size']}): {status}")
+
+        if not results:
+            print("Ningún trial terminó; no se exporta ningún modelo.")
+            return
+
+        # 3. Leaderboard: se ordena por validación; test_rmse solo se reporta
+        board = pd.DataFrame(results).sort_values(["pruned", "val_rmse_scaled"])
+        board.drop(columns="model_path").to_csv(LEADERBOARD_FILE, index=False)
+        print(board.drop(columns="model_path").to_string(index=False))
+
+        # 4. Exportar el ganador
+        winner = board.iloc[0]
+        shutil.copy(winner["model_path"], "ModelFinal.keras")
+        joblib.dump(scaler, "ScalerFinal.pkl")
+
+        with open("MetadataFinal.json", "w") as f:
+            json.dump({
+                "saved_at": pd.Timestamp.now(tz="UTC").isoformat(),
+                "model_path": "ModelFinal.keras",
+                "model_type": "LSTM autoregressive",
+                "window_size": int(winner["look_back"]),
+                "units": winner["units"],
+                "batch_size": int(winner["batch_size"]),
+                "val_rmse_scaled": float(winner["val_rmse_scaled"]),
+                "test_rmse": float(winner["test_rmse"]),
+                "notes": "Ganador de la búsqueda de hiperparámetros (python Emisions.py search).",
+                "scaler_min": float(scaler.data_min_[0]),
+                "scaler_max": float(scaler.data_max_[0])
+            }, f, indent=2)
+
+        print(f"Ganador: trial {winner['trial']} -> ModelFinal.keras "
+              f"(val {winner['val_rmse_scaled']:.4f}, test {winner['test_rmse']:.2f} RMSE)")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    # python Emisions.py          -> modelo de un paso
+    # python Emisions.py direct   -> modelo directo de HORIZON meses
+    # python Emisions.py search   -> búsqueda paralela, exporta el ganador
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    if mode == "direct":
+        main_direct()
+    elif mode == "search":
+        main_search()
+    else:
+        main()
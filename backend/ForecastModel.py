@@ -1,15 +1,67 @@
+import os
+import hashlib
+import logging
 import numpy as np
 import pandas as pd
 import joblib
 from keras.models import load_model
 
-LOOK_BACK = 12
 MODEL_FILE = "ModelFinal.keras"
 SCALER_FILE = "ScalerFinal.pkl"
+DIRECT_MODEL_FILE = "ModelDirect.keras"
+DIRECT_SCALER_FILE = "ScalerDirect.pkl"
+
+logger = logging.getLogger(__name__)
+
+# "autoregressive" (un mes por llamada) o "direct" (bloques de H meses)
+FORECAST_MODE = os.getenv("FORECAST_MODE", "autoregressive")
 
 MODEL = load_model(MODEL_FILE)
 SCALER = joblib.load(SCALER_FILE)
 
+# El modelo directo es opcional: se genera con `python Emisions.py direct`
+DIRECT_MODEL = None
+DIRECT_SCALER = None
+if FORECAST_MODE == "direct":
+    if os.path.exists(DIRECT_MODEL_FILE) and os.path.exists(DIRECT_SCALER_FILE):
+        DIRECT_MODEL = load_model(DIRECT_MODEL_FILE)
+        DIRECT_SCALER = joblib.load(DIRECT_SCALER_FILE)
+    else:
+        logger.warning(
+            f"FORECAST_MODE=direct pero falta {DIRECT_MODEL_FILE} o {DIRECT_SCALER_FILE}; "
+            "se usa el modelo autoregresivo"
+        )
+        FORECAST_MODE = "autoregressive"
+
+
+def serving_model():
+    """Modelo y scaler que corresponden a FORECAST_MODE."""
+    if FORECAST_MODE == "direct":
+        return DIRECT_MODEL, DIRECT_SCALER
+    return MODEL, SCALER
+
+
+# ===============================
+#  Versión del modelo + datos
+# ===============================
+def model_version():
+    """
+    Huella corta de los archivos que determinan el pronóstico servido.
+    Cambia al reentrenar, actualizar el CSV o cambiar FORECAST_MODE.
+    """
+    if FORECAST_MODE == "direct":
+        files = (DIRECT_MODEL_FILE, DIRECT_SCALER_FILE)
+    else:
+        files = (MODEL_FILE, SCALER_FILE)
+    h = hashlib.sha1(FORECAST_MODE.encode())
+    for path in (*files, "co2_mm_mlo.csv"):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+MODEL_VERSION = model_version()
+
 
 # ===============================
 #  Función para cargar tu dataset
@@ -20,23 +72,43 @@ def load_co2():
 
 
 # ===============================
-#  Autoregresivo reutilizable
+#  Rollout por bloques
 # ===============================
-def autoregressive_forecast(model, last_sequence, steps, scaler):
-    preds = []
-    window = last_sequence.reshape(1, LOOK_BACK, 1)
+def rollout_blocks(model, last_sequence, steps, cancel=None):
+    """
+    Genera los valores escalados bloque a bloque (1 mes para el modelo de
+    un paso, H meses para el directo) sin acumular toda la proyección.
+    Si `cancel` (threading.Event) se activa, se detiene antes de la
+    siguiente llamada al modelo.
+    """
+    look_back = model.input_shape[1]
+    window = last_sequence[-look_back:].reshape(1, look_back, 1)
+    remaining = steps
+
+    while remaining > 0:
+        if cancel is not None and cancel.is_set():
+            return
 
-    for _ in range(steps):
         # Usar el modelo directamente en vez de model.predict()
-        next_value = model(window, training=False).numpy()[0][0]
+        block = model(window, training=False).numpy()[0]
+
+        yield block[:remaining]
+        remaining -= len(block)
 
-        preds.append(next_value)
+        new_window = np.append(window.flatten(), block)[-look_back:]
+        window = new_window.reshape(1, look_back, 1)
 
-        new_window = np.append(window.flatten()[1:], next_value)
-        window = new_window.reshape(1, LOOK_BACK, 1)
 
-    preds = np.array(preds).reshape(-1, 1)
-    preds = scaler.inverse_transform(preds)
+# ===============================
+#  Autoregresivo reutilizable
+# ===============================
+def autoregressive_forecast(model, last_sequence, steps, scaler):
+    """
+    Proyección completa de `steps` meses. Con el modelo directo hace
+    ceil(steps / H) llamadas en vez de `steps`.
+    """
+    preds = np.concatenate(list(rollout_blocks(model, last_sequence, steps)))
+    preds = scaler.inverse_transform(preds.reshape(-1, 1))
     return preds
 
 
@@ -78,17 +150,18 @@ def forecast_co2(months):
     data = load_co2()
 
     # 3. Normalizar
-    data_scaled = SCALER.transform(data)
+    model, scaler = serving_model()
+    data_scaled = scaler.transform(data)
 
-    # 4. Última ventana para forecasting
-    last_seq = data_scaled[-LOOK_BACK:].flatten()
+    # 4. Serie para forecasting (cada modelo toma su propia ventana)
+    last_seq = data_scaled.flatten()
 
-    # 5. Forecast autoregresivo
+    # 5. Forecast autoregresivo (por bloques de H meses si el modo es directo)
     preds = autoregressive_forecast(
-        model=MODEL,
+        model=model,
         last_sequence=last_seq,
         steps=months,
-        scaler=SCALER
+        scaler=scaler
     )
 
     # 6. Fechas futuras
@@ -109,6 +182,41 @@ def forecast_co2(months):
     }
 
 
+# ===============================
+#   forecast_co2_stream(months)
+# ===============================
+def forecast_co2_stream(months, chunk_size=120, cancel=None):
+    """
+    Igual que forecast_co2 pero como generador: produce tuplas
+    (dates, predictions) de a lo sumo `chunk_size` meses a medida que
+    avanza el rollout, con memoria constante respecto a `months`.
+    Activar `cancel` (threading.Event) corta el rollout entre llamadas
+    al modelo.
+    """
+    data = load_co2()
+    model, scaler = serving_model()
+    data_scaled = scaler.transform(data)
+    last_seq = data_scaled.flatten()
+
+    # Primer mes futuro, sin construir todo el date_range histórico
+    next_date = pd.Timestamp("1958-03-01") + pd.DateOffset(months=len(data))
+
+    def flush(buffer):
+        preds = scaler.inverse_transform(np.array(buffer).reshape(-1, 1)).flatten()
+        dates = pd.date_range(start=next_date, periods=len(buffer), freq="MS")
+        return dates, preds
+
+    buffer = []
+    for block in rollout_blocks(model, last_seq, months, cancel):
+        buffer.extend(block)
+        while len(buffer) >= chunk_size:
+            yield flush(buffer[:chunk_size])
+            buffer = buffer[chunk_size:]
+            next_date += pd.DateOffset(months=chunk_size)
+
+    if buffer and not (cancel is not None and cancel.is_set()):
+        yield flush(buffer)
+
 
 # ===============================
 # Ejemplo de uso